@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings
 
 
@@ -10,13 +12,13 @@ class Settings(BaseSettings):
     extracted_tables: str = "tables"
     extracted_texts: str = "texts"
     parse_report: str = "parse_report.csv"
+    pdf_exclude_table_text: bool = True
 
 
-def init_settings() -> None:
-    global settings
-    settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return settings, created and validated only on the first call."""
+    return Settings()
 
 
-settings = None
-if not settings:
-    init_settings()
+settings = get_settings()
@@ -2,9 +2,16 @@
 
 import os
 
+from unidecode import unidecode
+
 from logger import log
 
 
+def fast_unidecode(text: str) -> str:
+    """Transliterate text to ASCII, skipping unidecode for text which already is ASCII."""
+    return text if text.isascii() else unidecode(text)
+
+
 class DocumentParser:
     """
     An abstract class responsible for reading and parsing document.
@@ -19,7 +26,7 @@ class DocumentParser:
         :param document_path: Full path to the PDF document.
         :param output_directory: Full path to directory, where parsing results are stored.
         """
-        log.info(f"Opening document {document_path}.")
+        log.info("Opening document %s.", document_path)
         self.document_name = os.path.splitext(os.path.basename(document_path))[0]
         self.output_directory = output_directory
         self.counters = {
@@ -80,6 +87,10 @@ class DocumentParser:
         """
         pass
 
+    def close(self) -> None:
+        """Release resources held by the opened document."""
+        pass
+
     def run(self) -> None:
         """Parse given document"""
         self.extract_table_of_content()
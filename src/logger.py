@@ -20,7 +20,7 @@ def config_logging(log_directory=None, level=logging.INFO):
     if log_directory is not None:
         os.makedirs(log_directory, exist_ok=True)
         log_path = os.path.join(log_directory, "log" + datetime.now().strftime("%Y-%m-%d_%H%M") + ".txt")
-        log.info(f"Configuring logging to file {log_path}.")
+        log.info("Configuring logging to file %s.", log_path)
     else:
         log_path = os.devnull
 
@@ -28,7 +28,7 @@ def config_logging(log_directory=None, level=logging.INFO):
         logging.root.removeHandler(handler)
 
     # Configure logging to file
-    logging.basicConfig(level=level, format='%(asctime)s %(levelname)-8s %(name)s %(funcName)s   %(message)s',
+    logging.basicConfig(level=level, format='%(asctime)s %(levelname)-8s %(name)s   %(message)s',
                         datefmt='%Y-%m-%d,%H:%M:%S',
                         filename=log_path,
                         filemode='w')
@@ -49,7 +49,4 @@ def config_logging(log_directory=None, level=logging.INFO):
     console.setFormatter(formatter)
     log.addHandler(console)
 
-    log.info(f'Configured logger. Logging level: {logging.getLevelName(level)}')
-
-
-config_logging()
\ No newline at end of file
+    log.info("Configured logger. Logging level: %s", logging.getLevelName(level))
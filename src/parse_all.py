@@ -1,17 +1,52 @@
 """
 Function responsible for parsing all available documents.
 """
+from concurrent.futures import ProcessPoolExecutor
 import csv
 import os
 
 from tqdm import tqdm
 
 from configuration import settings
-from logger import log
+from logger import config_logging, log
 from pdf_parser import PdfParser
 from word_parser import WordParser
 
 
+def _parse_one(document_path: str, output_directory: str) -> tuple[dict, list]:
+    """
+    Parse a single document in a worker process.
+
+    :param document_path: Full path to the PDF or Word document.
+    :param output_directory: Full path to directory, where parsing results are stored.
+    :return: extracted elements counters and image data of the parsed document.
+    """
+    if document_path.endswith(".pdf"):
+        # Read the file once, fitz and pdfplumber both parse the same bytes instead of opening the file each.
+        with open(document_path, "rb") as document_file:
+            parser = PdfParser(document_path, output_directory, stream=document_file.read())
+    else:
+        parser = WordParser(document_path, output_directory)
+    parser.run()
+    counters, image_data = parser.counters, parser.image_data
+    parser.close()
+    return counters, image_data
+
+
+def _parse_group(document_paths: list[str], output_directory: str) -> list[tuple[dict, list]]:
+    """
+    Parse documents sharing the same name in a single worker process, one after another.
+
+    Output files are named after the document name only, so e.g. X.pdf and X.docx write the same files. Parsed in
+    turn, the last document leaves complete files instead of two processes writing them at once.
+
+    :param document_paths: Full paths to the documents with the same name.
+    :param output_directory: Full path to directory, where parsing results are stored.
+    :return: extracted elements counters and image data of each parsed document.
+    """
+    return [_parse_one(document_path, output_directory) for document_path in document_paths]
+
+
 def parse_all_documents(
     input_directory: str = settings.file_location,
     output_directory: str = settings.parsed_data_directory,
@@ -30,37 +65,48 @@ def parse_all_documents(
 
     Additionally, two summary csv files ("parse_report.csv" and "images.csv") are created. The first summarizes
     extracted elements counters, and the second contains image titles extracted from each document.
+
+    Documents are parsed in parallel, one worker process per CPU core. Documents with the same name but a different
+    extension write the same output files, so they are parsed one after another in a single worker.
     """
     os.makedirs(output_directory, exist_ok=True)
 
-    counters = []
-    images = []
-    for document_name in tqdm(os.listdir(input_directory)):
-        document_path = os.path.join(input_directory, document_name)
-        if document_name.endswith("pdf"):
-            parser = PdfParser(document_path, output_directory)
-        elif document_name.endswith("docx"):
-            parser = WordParser(document_path, output_directory)
-        else:
-            continue
-        parser.run()
-        parser.counters.update({"document": document_name})
-        counters.append(parser.counters)
-        images.append(parser.image_data)
-    log.info(f"Storing counters to {settings.parse_report} file")
-    with open(os.path.join(output_directory, "parse_report.csv"), "w", newline="") as csvfile:
-        w = csv.DictWriter(csvfile, counters[0].keys())
-        w.writeheader()
-        w.writerows(counters)
-    log.info(f"Storing image data to {settings.extracted_images_file_name} file")
-    columns = ["document_name", "document_type", "figure_number", "figure_title", "page_number",
-               "image_filename", "extracted_image"]
-    with open(os.path.join(output_directory, settings.extracted_images_file_name), "w", newline="") as csvfile:
-        w = csv.DictWriter(csvfile, columns)
-        w.writeheader()
-        for sublist in images:
-            w.writerows(sublist)
+    with os.scandir(input_directory) as entries:
+        documents = [entry for entry in entries if entry.is_file() and entry.name.endswith((".pdf", ".docx"))]
+    groups = {}
+    for entry in documents:
+        groups.setdefault(os.path.splitext(entry.name)[0], []).append(entry)
+    for group in groups.values():
+        if len(group) > 1:
+            log.warning("Documents %s write the same output files, they are parsed one after another.",
+                        ", ".join(entry.name for entry in group))
+    document_groups = list(groups.values())
+    log.info("Storing counters to %s file", settings.parse_report)
+    log.info("Storing image data to %s file", settings.extracted_images_file_name)
+    counter_columns = ["toc", "images", "tables", "paragraphs", "document"]
+    image_columns = ["document_name", "document_type", "figure_number", "figure_title", "page_number",
+                     "image_filename", "extracted_image"]
+    with (
+        open(os.path.join(output_directory, settings.parse_report), "w", newline="") as report_file,
+        open(os.path.join(output_directory, settings.extracted_images_file_name), "w", newline="") as images_file,
+        ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=config_logging) as executor,
+    ):
+        report_writer = csv.DictWriter(report_file, counter_columns)
+        report_writer.writeheader()
+        images_writer = csv.DictWriter(images_file, image_columns)
+        images_writer.writeheader()
+        results = executor.map(
+            _parse_group,
+            [[entry.path for entry in group] for group in document_groups],
+            [output_directory] * len(document_groups),
+        )
+        for group, group_results in zip(document_groups, tqdm(results, total=len(document_groups))):
+            for entry, (counters, image_data) in zip(group, group_results):
+                counters.update({"document": entry.name})
+                report_writer.writerow(counters)
+                images_writer.writerows(image_data)
 
 
 if __name__ == "__main__":
+    config_logging()
     parse_all_documents()
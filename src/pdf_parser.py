@@ -1,35 +1,306 @@
 """
 Extract the content of a PDF document, including table of content, images, tables and text.
 """
+from bisect import bisect_right
+from functools import cached_property
+from io import BytesIO
+from itertools import accumulate
+import csv
 import os
 import re
 
 import fitz
-import pandas
 import pdfplumber
-from unidecode import unidecode
 
 from configuration import settings
-from document_parser import DocumentParser
-from logger import log
+from document_parser import DocumentParser, fast_unidecode
+from logger import config_logging, log
+
+_TOC_PATTERN = re.compile(r"^\d+(\.\d+)*\s+[A-Za-z\s]+\.+\s+\d+$")
+_TRAIL_DOTS = re.compile(r"\.+(\s+\d+)?$")
+_PAGE_TAIL = re.compile(r"(\d+)\s*$")
+_FIGURE_HEAD = re.compile(r"^Figure\s+\d+(?:[\s:-].*)?")
+_FIGURE_TITLE = re.compile(r"^(Figure\s+\d+)(?:[\s:-])-?(.*)")
+_TEXT_START = re.compile(r"^[A-Za-z0-9].*")
+_TABLE_TITLE = re.compile(r"^Table\s+\d+")
+_FIGURE_TITLE_SHORT = re.compile(r"^Figure\s+\d+")
+_PAGE_MARK = re.compile(r"^Page\s+\d+")
+_TOC1 = re.compile(r"^[\w\s]+\.+\s+\d+$")
+_TOC2 = re.compile(r"^(\d+(?:\.\d+)*)\.?\s+(.+)\d$")
+
+
+def _extract_page_images(
+    page_content: fitz.Page,
+    text_blocks: list[dict],
+    document_name: str,
+    final_directory: str,
+    page_number: int,
+) -> tuple[int, list[dict]]:
+    """
+    Extract images with figure labels from a single page of PDF document and save them.
+
+    :param page_content: PDF document page.
+    :param text_blocks: blocks of the page, as returned by page_content.get_text("dict").
+    :param document_name: Document name used in image file names.
+    :param final_directory: directory where images are saved.
+    :param page_number: number of the page, starting from 1.
+    :return: number of saved images and data of every figure found on the page.
+    """
+    page_pixmap = None
+
+    def save_image(save_as: str, final_directory: str, img_bbox: fitz.Rect) -> None:
+        """Save extracted image.
+
+        The page is rendered once, when its first image is saved, and each image is cropped from that pixmap.
+
+        :param save_as: image name
+        :param final_directory: directory where image will be saved.
+        :param img_bbox: image bounding box.
+        """
+        nonlocal page_pixmap
+        if page_pixmap is None:
+            page_pixmap = page_content.get_pixmap(matrix=fitz.Matrix(2, 2))
+        clip = (img_bbox * fitz.Matrix(2, 2)).irect & page_pixmap.irect
+        image = fitz.Pixmap(page_pixmap.colorspace, clip, page_pixmap.alpha)
+        image.copy(page_pixmap, clip)
+        image.save(os.path.join(final_directory, save_as))
+
+    def first_span(block_idx: int) -> dict | None:
+        """Return the first span of a text block, or None if there is no such block or it has no text."""
+        if not 0 <= block_idx < len(text_blocks):
+            return None
+        lines = text_blocks[block_idx].get("lines")
+        if not lines or not lines[0]["spans"]:
+            return None
+        return lines[0]["spans"][0]
+
+    counter = 0
+    image_data = []
+    for idx, block in enumerate(text_blocks):
+        for line in block.get("lines", ()):
+            spans = line["spans"]
+            if not spans:
+                continue
+            title_block = spans[0]
+            title_text = title_block["text"].strip()
+            if not _FIGURE_HEAD.match(title_text) or "Bold" not in title_block["font"]:
+                continue
+            title_match = _FIGURE_TITLE.match(title_text)
+            if not title_match:
+                continue
+            tx0, ty0, tx1, ty1 = title_block["bbox"]
+            figure_number = title_match.group(1)
+            save_as = f"{document_name}_{page_number}_{figure_number}.png"
+            figure_data = {
+                "document_name": document_name,
+                "document_type": "pdf",
+                "figure_number": figure_number,
+                "figure_title": title_match.group(2).strip(),
+                "page_number": page_number,
+                "image_filename": save_as,
+                "extracted_image": "No. Image on a different page"
+            }
+            # Caption in the first block of the page has no previous block, the image can only follow it.
+            is_image_above = False
+            if idx > 0:
+                prev_block = first_span(idx - 1)
+                if prev_block is None:
+                    # Previous block holds no text (e.g. a raster image), the figure is not extracted.
+                    continue
+                _, _, px1, py1 = prev_block["bbox"]
+                is_image_above = px1 - tx0 > 80 and not _TEXT_START.match(prev_block["text"])
+            next_block = first_span(idx + 1)
+            image_data.append(figure_data)
+            if next_block is None:
+                break
+            _, _, nx1, ny1 = next_block["bbox"]
+
+            if is_image_above:
+                img_bbox = fitz.Rect(-tx1, -ty1, px1, py1)
+                save_image(save_as, final_directory, img_bbox)
+                image_data[-1]["extracted_image"] = "Yes"
+                counter += 1
+
+            elif nx1 - tx0 > 80:
+                img_bbox = fitz.Rect(tx0 - 5, ty0 + 12, nx1, ny1)
+                save_image(save_as, final_directory, img_bbox)
+                image_data[-1]["extracted_image"] = "Yes"
+                counter += 1
+
+            elif nx1 - tx0 < 80:
+                for j in range(2, 6):
+                    next_block = first_span(idx + j)
+                    if next_block is None:
+                        break
+                    _, _, nx1, ny1 = next_block["bbox"]
+                    if nx1 - tx0 > 80 and next_block["text"] == " ":
+                        img_bbox = fitz.Rect(tx0 - 5, ty0 + 15, nx1, ny1)
+                        save_image(save_as, final_directory, img_bbox)
+                        image_data[-1]["extracted_image"] = "Yes"
+                        counter += 1
+    return counter, image_data
+
+
+def _keep_sentence(text: str) -> bool:
+    """
+    Check if the sentence is a part of document text.
+
+    :param text: sentence extracted from PDF document.
+    :return: False for empty sentences, table and figure titles, page markers and table of content lines.
+    """
+    table_title = _TABLE_TITLE.match(text)
+    figure_title = _FIGURE_TITLE_SHORT.match(text)
+    page_marker = _PAGE_MARK.match(text)
+    table_of_content_1 = _TOC1.match(text)
+    table_of_content_2 = _TOC2.match(text)
+    return ((text.replace(" ", "") != "")
+            and (not table_title)
+            and (not figure_title)
+            and (not page_marker)
+            and (not table_of_content_1)
+            and (not table_of_content_2)
+            )
+
+
+def _extract_page_tables(page: pdfplumber.page.Page) -> tuple[list[list[list]], list[tuple]]:
+    """
+    Extract tables from a single page of PDF document.
+
+    :param page: PDF document page opened with pdfplumber.
+    :return: rows and bounding box of each table found on the page.
+    """
+    table_objects = page.find_tables(
+        table_settings={
+            "vertical_strategy": "lines",
+            "horizontal_strategy": "lines",
+            "intersection_x_tolerance": 2,
+            "snap_tolerance": 8,
+            "join_tolerance": 40,
+        }
+    )
+    return [table.extract() for table in table_objects], [table.bbox for table in table_objects]
+
+
+def _extract_page_sentences(page: pdfplumber.page.Page, table_bboxes: list[tuple] | None) -> list[tuple]:
+    """
+    Extract sentences placed outside of tables from a single page of PDF document.
+
+    :param page: PDF document page opened with pdfplumber.
+    :param table_bboxes: bounding boxes of all tables detected on the page by extract_tables, including tables it
+        does not save. None if tables were not searched for on the page yet.
+    :return: (text, page_number, font_type, is_bold, font_size) tuple for each kept sentence.
+    """
+    def get_table_settings(strategy: str) -> dict:
+        """Return table settings dictionary. Strategy should be one of `explicit`, `lines`."""
+        assert strategy in ("explicit", "lines"), "Table settings strategy should be 'explicit' or 'lines'."
+        return {
+            "vertical_strategy": strategy,
+            "horizontal_strategy": strategy,
+            "explicit_vertical_lines": page.curves + page.edges,
+            "explicit_horizontal_lines": page.curves + page.edges,
+            "snap_tolerance": 8,
+            "join_tolerance": 50,
+        }
+
+    page_number = page.page_number
+    if table_bboxes is not None:
+        bounding_boxes = table_bboxes
+    else:
+        try:
+            bounding_boxes = [table.bbox for table in page.find_tables(table_settings=get_table_settings("explicit"))]
+        except ValueError:
+            bounding_boxes = [table.bbox for table in page.find_tables(table_settings=get_table_settings("lines"))]
+    # Sort tables by top edge, to search only the tables starting above the object. Running maximum of bottom
+    # edges tells when none of the remaining tables reaches down to the object.
+    sorted_bboxes = sorted(bounding_boxes, key=lambda bbox: bbox[1])
+    tops = [bbox[1] for bbox in sorted_bboxes]
+    max_bottoms = list(accumulate((bbox[3] for bbox in sorted_bboxes), max))
+
+    def not_within_bboxes(obj) -> bool:
+        """
+        Check if the object is in any of the table's bounding box.
+
+        :param obj: text object from PDF document
+        :return: boolean indicating text object is outside a table bounding box
+        """
+        v_mid = (obj["top"] + obj["bottom"]) / 2
+        h_mid = (obj["x0"] + obj["x1"]) / 2
+        i = bisect_right(tops, v_mid) - 1
+        while i >= 0 and max_bottoms[i] > v_mid:
+            x0, _, x1, bottom = sorted_bboxes[i]
+            if (h_mid >= x0) and (h_mid < x1) and (v_mid < bottom):
+                return False
+            i -= 1
+        return True
+
+    text_page = page.filter(not_within_bboxes) if sorted_bboxes else page
+    sentence_lines = text_page.extract_words(
+        keep_blank_chars=True,
+        use_text_flow=True,
+        extra_attrs=["fontname", "size"],
+    )
+    texts = [fast_unidecode(sentence["text"]) for sentence in sentence_lines]
+    return [
+        (text, page_number, sentence["fontname"], "bold" in sentence["fontname"].lower(), sentence["size"])
+        for text, sentence in zip(texts, sentence_lines)
+        if _keep_sentence(text)
+    ]
 
 
 class PdfParser(DocumentParser):
     """A Class responsible for reading and parsing PDF document."""
 
-    def __init__(self, document_path: str, output_directory: str) -> None:
+    def __init__(self, document_path: str, output_directory: str, stream: bytes | None = None) -> None:
         """
         Open document.
 
-        As for different purposes two independent parsing libraries are used: fitz (PyMuPDF) and pdfplumber,
-        both parsers are loaded here.
+        As for different purposes two independent parsing libraries are used: fitz (PyMuPDF) and pdfplumber.
+        fitz is loaded here, pdfplumber only when it is first used.
 
         :param document_path: Full path to the PDF document.
         :param output_directory: Full path to directory, where parsing results are stored.
+        :param stream: Content of the PDF document already read into memory. If provided, fitz and the pdfplumber
+            handle used by table and text extraction both read these bytes, and the file is not opened again.
         """
         super().__init__(document_path, output_directory)
-        self.document_fitz = fitz.open(document_path)
-        self.document_plumber = pdfplumber.open(document_path)
+        self.document_path = document_path
+        self._stream = stream
+        if stream is None:
+            self.document_fitz = fitz.open(document_path)
+        else:
+            self.document_fitz = fitz.open(stream=stream, filetype="pdf")
+        self._page_blocks = None
+        self._page_table_bboxes = {}
+
+    @cached_property
+    def document_plumber(self) -> pdfplumber.PDF:
+        """
+        Document opened with pdfplumber, on first access.
+
+        The handle is shared by table and text extraction, so each page is parsed by pdfplumber only once.
+        """
+        if self._stream is None:
+            return pdfplumber.open(self.document_path)
+        return pdfplumber.open(BytesIO(self._stream))
+
+    def close(self) -> None:
+        """Close the document in both parsing libraries."""
+        self.document_fitz.close()
+        # Close pdfplumber only if it was opened, and drop the handle together with its parsed pages.
+        document_plumber = self.__dict__.pop("document_plumber", None)
+        if document_plumber is not None:
+            document_plumber.close()
+        self._stream = None
+
+    def _prepare(self) -> None:
+        """
+        Read structured content of each page once, it is shared by image and text extraction.
+
+        Reading blocks with get_text("dict") is the most expensive fitz operation, so it is never repeated. Blocks
+        hold the content of embedded images, so they are kept only when text is read from fitz as well.
+        """
+        if self._page_blocks is None:
+            self._page_blocks = [page.get_text("dict")["blocks"] for page in self.document_fitz]
 
     def extract_table_of_content(self) -> None:
         """
@@ -37,7 +308,8 @@ class PdfParser(DocumentParser):
 
         TOC is extracted using PyMuPDF library. Unfortunately it cannot recognize TOC in each document.
          In case this method doesn't return anything, the second try uses regular expression. In this approach
-         first 21 pages are checked (we assume that TOC cannot be later in the document).
+         first 21 pages are checked (we assume that TOC cannot be later in the document), and the search stops at
+         the first page without TOC lines following the TOC pages.
         """
         final_directory = os.path.join(self.output_directory, settings.extracted_table_of_content)
         os.makedirs(final_directory, exist_ok=True)
@@ -48,24 +320,28 @@ class PdfParser(DocumentParser):
             page_number = content[2]
             table_of_content.append((title, page_number))
         if len(table_of_content) == 0:
-            try:
-                for i in range(21):
-                    page = self.document_fitz[i]
-                    text = page.get_text("text")
-                    lines = text.split("\n")
-                    for line in lines:
-                        line = line.strip()
-                        toc_pattern = r"^\d+(\.\d+)*\s+[A-Za-z\s]+\.+\s+\d+$"
-                        title_match = re.match(toc_pattern, line)
-                        if line != "" and title_match:
-                            remove_trailing_dots = re.sub(r"\.+(\s+\d+)?$", "", line)
-                            page_number = re.search(r"(\d+)\s*$", line)
-                            table_of_content.append((remove_trailing_dots, page_number.group(1)))
-            except IndexError:
+            for i in range(min(21, self.document_fitz.page_count)):
+                titles_found = len(table_of_content)
+                text = self.document_fitz[i].get_text("text")
+                lines = text.split("\n")
+                for line in lines:
+                    line = line.strip()
+                    title_match = _TOC_PATTERN.match(line)
+                    if line != "" and title_match:
+                        remove_trailing_dots = _TRAIL_DOTS.sub("", line)
+                        page_number = _PAGE_TAIL.search(line)
+                        table_of_content.append((remove_trailing_dots, page_number.group(1)))
+                if titles_found > 0 and len(table_of_content) == titles_found:
+                    # TOC is placed on consecutive pages, so it ended on the previous page.
+                    break
+            if len(table_of_content) == 0:
                 log.warning("No table of content found.")
-        log.info(f"Extracted TOC with {len(table_of_content)} titles.")
-        toc_df = pandas.DataFrame(table_of_content, columns=["title", "page_number"])
-        toc_df.to_csv(os.path.join(final_directory, f"{self.document_name}.csv"), index=False)
+        log.info("Extracted TOC with %s titles.", len(table_of_content))
+        toc_path = os.path.join(final_directory, f"{self.document_name}.csv")
+        with open(toc_path, "w", newline="", encoding="utf-8") as csvfile:
+            w = csv.writer(csvfile, lineterminator="\n")
+            w.writerow(("title", "page_number"))
+            w.writerows(table_of_content)
         self.counters['toc'] = len(table_of_content)
 
     def extract_images(self) -> None:
@@ -74,95 +350,26 @@ class PdfParser(DocumentParser):
         final_directory = os.path.join(self.output_directory, settings.extracted_images)
         os.makedirs(final_directory, exist_ok=True)
 
-        def save_image(save_as: str, final_directory: str, img_bbox: fitz.Rect) -> None:
-            """Save extracted image.
-
-            :param save_as: image name
-            :param final_directory: directory where image will be saved.
-            :param img_bbox: image bounding box.
-            """
-            image = page_content.get_pixmap(matrix=fitz.Matrix(1, 1).prescale(2, 2), clip=img_bbox)
-            image.save(os.path.join(final_directory, save_as))
-
+        if not settings.pdf_exclude_table_text:
+            self._prepare()
         counter = 0
         image_data = []
         for page_number, page_content in enumerate(self.document_fitz, start=1):
-            text_blocks = page_content.get_text("dict")["blocks"]
-            for idx, block in enumerate(text_blocks):
-                try:
-                    for i in range(len(block["lines"]) + 1):
-                        figure_block = block["lines"][i]["spans"][0]
-                        figure_match = re.match(r"^Figure\s+\d+(?:[\s:-].*)?", figure_block["text"].strip())
-                        font_type = figure_block["font"]
-                        if "lines" in block and figure_match and "Bold" in font_type:
-                            title_block = block["lines"][i]["spans"][0]
-                            title_bbox = fitz.Rect(title_block["bbox"])
-                            title_text = title_block["text"].strip()
-                            title_match = re.match(r"^(Figure\s+\d+)(?:[\s:-])-?(.*)", title_text)
-                            figure_number = title_match.group(1)
-                            save_as = f"{self.document_name}_{page_number}_{figure_number}.png"
-                            figure_data = {
-                                "document_name": self.document_name,
-                                "document_type": "pdf",
-                                "figure_number": figure_number,
-                                "figure_title": title_match.group(2).strip(),
-                                "page_number": page_number,
-                                "image_filename": save_as,
-                                "extracted_image": "No. Image on a different page"
-                            }
-                            text_match = r"^[A-Za-z0-9].*"
-                            prev_block = text_blocks[idx - 1]["lines"][0]["spans"][0]
-                            is_prev_text = re.match(text_match, prev_block["text"])
-                            prev_bbox = fitz.Rect(prev_block["bbox"])
-                            try:
-                                next_block = text_blocks[idx + 1]["lines"][0]["spans"][0]
-                                next_bbox = fitz.Rect(next_block["bbox"])
-                            except (KeyError, IndexError):
-                                image_data.append(figure_data)
-                                break
-
-                            image_data.append(figure_data)
-                            if prev_bbox.x1 - title_bbox.x0 > 80 and not is_prev_text:
-                                prev_block = text_blocks[idx - 1]["lines"][0]["spans"][0]
-                                prev_bbox = fitz.Rect(prev_block["bbox"])
-                                img_bbox = fitz.Rect(
-                                    -title_bbox.x1,
-                                    -title_bbox.y1,
-                                    prev_bbox.x1,
-                                    prev_bbox.y1,
-                                )
-                                save_image(save_as, final_directory, img_bbox)
-                                image_data[-1]["extracted_image"] = "Yes"
-                                counter += 1
-
-                            elif next_bbox.x1 - title_bbox.x0 > 80:
-                                img_bbox = fitz.Rect(
-                                    title_bbox.x0 - 5,
-                                    title_bbox.y0 + 12,
-                                    next_bbox.x1,
-                                    next_bbox.y1,
-                                )
-                                save_image(save_as, final_directory, img_bbox)
-                                image_data[-1]["extracted_image"] = "Yes"
-                                counter += 1
-
-                            elif next_bbox.x1 - title_bbox.x0 < 80:
-                                for j in range(2, 6):
-                                    next_block = text_blocks[idx + j]["lines"][0]["spans"][0]
-                                    next_bbox = fitz.Rect(next_block["bbox"])
-                                    if next_bbox.x1 - title_bbox.x0 > 80 and next_block["text"] == " ":
-                                        img_bbox = fitz.Rect(
-                                            title_bbox.x0 - 5,
-                                            title_bbox.y0 + 15,
-                                            next_bbox.x1,
-                                            next_bbox.y1,
-                                        )
-                                        save_image(save_as, final_directory, img_bbox)
-                                        image_data[-1]["extracted_image"] = "Yes"
-                                        counter += 1
-                except (KeyError, IndexError, AttributeError):
-                    pass
-        log.info(f"...done. Successfully extracted {counter} images.")
+            if self._page_blocks is not None:
+                text_blocks = self._page_blocks[page_number - 1]
+            else:
+                # Only image extraction reads the blocks, they are released with the page.
+                text_blocks = page_content.get_text("dict")["blocks"]
+            page_counter, page_image_data = _extract_page_images(
+                page_content,
+                text_blocks,
+                self.document_name,
+                final_directory,
+                page_number,
+            )
+            counter += page_counter
+            image_data.extend(page_image_data)
+        log.info("...done. Successfully extracted %s images.", counter)
         self.counters["images"] = counter
         self.image_data = image_data
 
@@ -172,129 +379,84 @@ class PdfParser(DocumentParser):
         os.makedirs(final_directory, exist_ok=True)
         counter = 0
         log.info("Extracting tables...")
+        # Pages are parsed in turn, documents are already parsed in parallel by parse_all.
         for page in self.document_plumber.pages:
-            table_objects = page.find_tables(
-                table_settings={
-                    "vertical_strategy": "lines",
-                    "horizontal_strategy": "lines",
-                    "intersection_x_tolerance": 2,
-                    "snap_tolerance": 8,
-                    "join_tolerance": 40,
-                }
-            )
-            for table_counter, table in enumerate(table_objects, start=1):
-                extract_table = table.extract()
+            page_number = page.page_number
+            # Boxes of all detected tables are kept, also of those not saved below for having a single column, so
+            # text extraction skips the text of every table found on the page.
+            page_tables, self._page_table_bboxes[page_number] = _extract_page_tables(page)
+            for table_counter, extract_table in enumerate(page_tables, start=1):
                 header = extract_table[0]
                 data = extract_table[1:]
-                save_as = f"{self.document_name}_{page.page_number}_{table_counter}.csv"
+                save_as = f"{self.document_name}_{page_number}_{table_counter}.csv"
                 if len(header) >= 2:
-                    table_dataframe = pandas.DataFrame(data, columns=header)
-                    table_dataframe.dropna(axis=0, how="all")
-                    table_dataframe.to_csv(os.path.join(final_directory, save_as), index=False)
+                    table_path = os.path.join(final_directory, save_as)
+                    # Large buffer lets the whole table reach the file in a single write.
+                    with open(table_path, "w", newline="", encoding="utf-8", buffering=1 << 20) as csvfile:
+                        w = csv.writer(csvfile, lineterminator="\n")
+                        w.writerow(header)
+                        w.writerows(row for row in data if any(cell not in (None, "") for cell in row))
                     counter += 1
-                log.debug(f"Extracted table {header}.")
-        log.info(f"...done. Successfully extracted {counter} tables.")
+                log.debug("Extracted table %s.", header)
+        log.info("...done. Successfully extracted %s tables.", counter)
         self.counters['tables'] = counter
 
+    def _extract_texts_fitz(self) -> list[tuple]:
+        """
+        Extract sentences from the blocks read by fitz.
+
+        Unlike pdfplumber, text placed inside of tables is not excluded.
+
+        :return: (text, page_number, font_type, is_bold, font_size) tuple for each kept sentence.
+        """
+        self._prepare()
+        extracted_sentences = []
+        for page_number, text_blocks in enumerate(self._page_blocks, start=1):
+            for block in text_blocks:
+                for line in block.get("lines", ()):
+                    for span in line["spans"]:
+                        text = fast_unidecode(span["text"]).strip()
+                        font_type = span["font"]
+                        if _keep_sentence(text):
+                            is_bold = "bold" in font_type.lower()
+                            extracted_sentences.append((text, page_number, font_type, is_bold, span["size"]))
+        return extracted_sentences
+
     def extract_texts(self) -> None:
-        """Extract text from PDF document and save as CSV file."""
+        """
+        Extract text from PDF document and save as CSV file.
+
+        By default pdfplumber is used, which skips text placed inside of tables. When table text exclusion is
+        disabled in settings, the text is read from the blocks already extracted by fitz.
+        """
         log.info("Extracting text...")
         final_directory = os.path.join(self.output_directory, settings.extracted_texts)
         os.makedirs(final_directory, exist_ok=True)
 
-        def not_within_bboxes(obj) -> bool:
-            """
-            Check if the object is in any of the table's bounding box.
-
-            :param obj: text object from PDF document
-            :return: boolean indicating text object is outside a table bounding box
-            """
-
-            def obj_in_bbox(_bbox) -> bool:
-                """
-                Get the bounding box dimensions of a text object
-
-                :param _bbox: table bounding box
-                :return: boolean indicating if text object is in a table bounding box
-                """
-                v_mid = (obj["top"] + obj["bottom"]) / 2
-                h_mid = (obj["x0"] + obj["x1"]) / 2
-                x0, top, x1, bottom = _bbox
-                return (h_mid >= x0) and (h_mid < x1) and (v_mid >= top) and (v_mid < bottom)
-
-            return not any(obj_in_bbox(__bbox) for __bbox in bounding_boxes)
-
-        def get_table_settings(strategy: str) -> dict:
-            """Return table settings dictionary. Strategy should be one of `explicit`, `lines`."""
-            assert strategy in ("explicit", "lines"), "Table settings strategy should be 'explicit' or 'lines'."
-            return {
-                "vertical_strategy": strategy,
-				"horizontal_strategy": strategy,
-				"explicit_vertical_lines": page.curves + page.edges,
-				"explicit_horizontal_lines": page.curves + page.edges,
-				"snap_tolerance": 8,
-				"join_tolerance": 50,
-    		}
-
-        extracted_sentences = []
-        for page in self.document_plumber.pages:
-            try:
-                bounding_boxes = [
-                    table.bbox for table in page.find_tables(table_settings=get_table_settings("explicit"))
-                ]
-            except ValueError:
-                bounding_boxes = [
-                    table.bbox for table in page.find_tables(table_settings=get_table_settings("lines"))
-                ]
-            sentence_lines = page.filter(not_within_bboxes).extract_words(
-                keep_blank_chars=True,
-                use_text_flow=True,
-                extra_attrs=["fontname", "size"],
-            )
-            for sentence in sentence_lines:
-                text = unidecode(sentence["text"])
-                font_type = sentence["fontname"]
-                font_size_ = sentence["size"]
-                is_bold = False
-                if "bold" in font_type.lower():
-                    is_bold = True
-                table_title = re.match(r"^Table\s+\d+", text)
-                figure_title = re.match(r"^Figure\s+\d+", text)
-                page_marker = re.match(r"^Page\s+\d+", text)
-                table_of_content_1 = re.match(r"^[\w\s]+\.+\s+\d+$", text)
-                table_of_content_2 = re.match(r"^(\d+(?:\.\d+)*)\.?\s+(.+)\d$", text)
-
-                if ((text.replace(" ", "") != "")
-                    and (not table_title)
-                    and (not figure_title)
-                    and (not page_marker)
-                    and (not table_of_content_1)
-                    and (not table_of_content_2)
-                    ):
-                    extracted_sentences.append((text, page.page_number, font_type, is_bold, font_size_))
-        text_data_frame = pandas.DataFrame(
-            extracted_sentences,
-            columns=["text", "page_number", "font_type", "is_bold", "font_size"],
-        )
+        if settings.pdf_exclude_table_text:
+            extracted_sentences = []
+            for page in self.document_plumber.pages:
+                table_bboxes = self._page_table_bboxes.get(page.page_number)
+                extracted_sentences.extend(_extract_page_sentences(page, table_bboxes))
+        else:
+            extracted_sentences = self._extract_texts_fitz()
+        # Bold sentences are headings, sentences between two headings are the body text of the first one.
+        bold_indexes = [idx for idx, (_, _, _, is_bold, _) in enumerate(extracted_sentences) if is_bold]
         headers = []
         body_text = []
         page_num = []
-        tmp = []
-        for _, row_value in text_data_frame.iterrows():
-            page_num_ = row_value.page_number
-            text = row_value.text
-            if row_value.is_bold:
-                headers.append(text)
-                body_text.append("\n".join(tmp))
-                page_num.append(page_num_)
-                tmp = []
-            else:
-                tmp.append(text)
-        body_text.append("\n".join(tmp))
-        body_text = body_text[1:]
-        text_df = pandas.DataFrame(zip(headers, body_text, page_num), columns=["heading", "text", "page_number"])
-        text_df.to_csv(os.path.join(final_directory, f"{self.document_name}.csv"), index=False)
-        log.info(f"...done. Successfully extracted {len(headers)} paragraphs.")
+        for heading_idx, next_heading_idx in zip(bold_indexes, bold_indexes[1:] + [len(extracted_sentences)]):
+            text, page_number, _, _, _ = extracted_sentences[heading_idx]
+            headers.append(text)
+            body = extracted_sentences[heading_idx + 1:next_heading_idx]
+            body_text.append("\n".join(sentence[0] for sentence in body))
+            page_num.append(page_number)
+        texts_path = os.path.join(final_directory, f"{self.document_name}.csv")
+        with open(texts_path, "w", newline="", encoding="utf-8", buffering=1 << 20) as csvfile:
+            w = csv.writer(csvfile, lineterminator="\n")
+            w.writerow(("heading", "text", "page_number"))
+            w.writerows(zip(headers, body_text, page_num))
+        log.info("...done. Successfully extracted %s paragraphs.", len(headers))
         self.counters['paragraphs'] = len(headers)
 
 
@@ -303,21 +465,26 @@ def parse_all_pdf_documents(
     output_directory: str = settings.parsed_data_directory,
     ) -> None:
     """Parse all pdf documents that exist in input_directory and save results to output_directory."""
-    for document in os.listdir(input_directory):
-        if document.endswith("pdf"):
+    with os.scandir(input_directory) as entries:
+        documents = list(entries)
+    for entry in documents:
+        document = entry.name
+        if entry.is_file() and document.endswith(".pdf"):
             try:
-                parser = PdfParser(os.path.join(input_directory, document), output_directory)
+                parser = PdfParser(entry.path, output_directory)
             except (fitz.EmptyFileError, fitz.FileDataError) as e:
-                log.error(f"{document} cannot be parsed. Error: {e}")
+                log.error("%s cannot be parsed. Error: %s", document, e)
                 break
             parser.extract_table_of_content()
             parser.extract_images()
             parser.extract_tables()
             parser.extract_texts()
-            log.info(f"{document} successfully processed.")
+            parser.close()
+            log.info("%s successfully processed.", document)
         else:
-            log.info(f"Skipping not a PDF document {document}.")
+            log.info("Skipping not a PDF document %s.", document)
 
 
 if __name__ == "__main__":
+    config_logging()
     parse_all_pdf_documents()
@@ -2,61 +2,238 @@
 Extract the contents of a Word document, including table of contents, text, images and tables.
 Note that .doc files from Word 2003 and earlier will not work
 """
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from functools import partial
+from typing import Iterator, NamedTuple
 import csv
+import gc
 import os
 import re
 
 import docx
-import docx2txt
-import pandas
 from docx import Document
+from docx.oxml.ns import nsmap, qn
 from docx.image.exceptions import UnrecognizedImageError
 from docx.opc.exceptions import PackageNotFoundError
-from unidecode import unidecode
-from xml.etree import ElementTree as ET
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from lxml import etree
 from zipfile import BadZipFile
 
 from configuration import settings
-from document_parser import DocumentParser
-from logger import log
+from document_parser import DocumentParser, fast_unidecode
+from logger import config_logging, log
+
+_TOC_RE = re.compile(r"\d+(\.\d+)*\s+[A-Za-z].*\d+$")
+# Numbered caption ("Figure 3: title") or caption without a number ("Figure - title"), matched in one pass.
+_FIGURE_RE = re.compile(
+    r"^(?:(?P<number>Figure\s+\d+(?:[:\.-]\d+)?)\s*(?P<title>.*)"
+    r"|(?P<prefix>Figure\s+)(?:[\s:-])-?(?P<part_title>.*))"
+)
+_TABLE_RE = re.compile(r"^Table\s+\d+")
+_FIG_TITLE_RE = re.compile(r"^Figure\s+\d+")
+_RUN_TEXTS = etree.XPath(".//w:r//w:t", namespaces={"w": nsmap["w"]})
+_DRAWING_XPATH = etree.XPath("w:drawing/wp:inline", namespaces={"w": nsmap["w"], "wp": nsmap["wp"]})
+_PARAGRAPH_TAG = qn("w:p")
+_TABLE_TAG = qn("w:tbl")
+_GRAPHIC_DATA = "{http://schemas.openxmlformats.org/drawingml/2006/main}graphicData"
+_DOCUMENT_CACHE_SIZE = 8
+# Parsed documents by (path, modification time), least recently used first.
+_documents: OrderedDict[tuple[str, float], Document] = OrderedDict()
+
+
+def _load_document(document_path: str) -> Document:
+    """
+    Open Word document, reusing the parsed package while the file is unchanged.
+
+    Used only by parsers created with reuse_document, the cache keeps up to _DOCUMENT_CACHE_SIZE packages alive.
+
+    :param document_path: Full path to the Word document.
+    """
+    try:
+        modification_time = os.path.getmtime(document_path)
+    except OSError:
+        # python-docx reports a missing file with PackageNotFoundError, expected by callers.
+        return Document(document_path)
+    # Modification time is part of the key, so a changed file is opened again.
+    key = (document_path, modification_time)
+    if key in _documents:
+        _documents.move_to_end(key)
+        return _documents[key]
+    document = Document(document_path)
+    _documents[key] = document
+    if len(_documents) > _DOCUMENT_CACHE_SIZE:
+        _documents.popitem(last=False)
+    return document
+
+
+class _FigureMatch(NamedTuple):
+    """Caption label and title of a figure, read by _save_image like groups 1 and 2 of a match."""
+
+    label: str
+    title: str
+
+    def group(self, index: int) -> str:
+        return self[index - 1]
+
+
+def _found_image_with_title(
+    document_docx: "docx.document.Document",
+    paragraph: "docx.text.paragraph.Paragraph",
+) -> "docx.parts.image.ImagePart | bool":
+    """Find image part of the first drawing in paragraph, False if the image format is not recognized."""
+    for run in paragraph.runs:
+        for inline in _DRAWING_XPATH(run._r):
+            # Drawings without a picture (e.g. charts) have no blip pointing to an image part.
+            blip = next(inline.iter(qn("a:blip")), None)
+            if blip is None:
+                continue
+            image_part = document_docx.part.related_parts[blip.get(qn("r:embed"))]
+            try:
+                # Reading the image header validates the format, the part itself is returned.
+                image_part.image
+                return image_part
+            except UnrecognizedImageError:
+                return False
+
+
+def _save_image(
+    figure_match: "re.Match | _FigureMatch",
+    data: dict,
+    image: "docx.parts.image.ImagePart | bool",
+    counter: int | str,
+    document_name: str,
+    final_directory: str,
+) -> dict:
+    """
+    Save extracted image and describe it in data.
+
+    :param figure_match: Caption label and title, groups 1 and 2 respectively.
+    :param data: Image description, updated in place.
+    :param image: Image part to save, False if the image has a bad format.
+    :param counter: Suffix appended to the caption label.
+    :param document_name: Name of the parsed document, prefix of the image file name.
+    :param final_directory: Directory where the image is saved.
+    """
+    save_as = f"{document_name}_{figure_match.group(1)}{counter}.png"
+    if image:
+        with open(os.path.join(final_directory, save_as), "wb") as img:
+            img.write(image.blob)
+        data.update(
+            {
+                "figure_number": f"{figure_match.group(1)}{counter}",
+                "figure_title": figure_match.group(2), "image_filename": save_as,
+            }
+        )
+        return data
+    else:
+        data.update(
+            {
+                "figure_number": f"{figure_match.group(1)}{counter}",
+                "figure_title": figure_match.group(2), "image_filename": "Image not extracted",
+                "extracted_image": "No. Image has a bad format.",
+            }
+        )
+        return data
 
 
 class WordParser(DocumentParser):
     """A class responsible for reading and parsing word documents."""
 
-    def __init__(self, document_path: str, output_directory: str = None) -> None:
+    def __init__(self, document_path: str, output_directory: str = None, reuse_document: bool = False) -> None:
         """
         Open Word document.
 
-        As for different purposes two independent parsing libraries are used: docx (python-docx) and docx2txt,
-        both parsers are loaded here.
+        Document is parsed once with python-docx, all extraction methods read the same element tree.
 
         :param document_path: Full path to location of documents.
         :param output_directory: Location where parsed data are saved. If not provided, execution will not succeed.
+        :param reuse_document: Share the parsed package with other parsers of the same unchanged file, for callers
+            creating several parsers of one document. Batch parsing opens each file once and leaves it disabled.
         """
         super().__init__(document_path, output_directory)
-        self.document_docx = Document(document_path)
-        self.document_docx2txt = docx2txt.process(document_path)
+        if reuse_document:
+            self.document_docx = _load_document(document_path)
+        else:
+            self.document_docx = Document(document_path)
+        # The body is indexed in one pass, python-docx would otherwise walk it again on every access.
+        body = self.document_docx._body
+        self._paragraphs = []
+        self._image_anchor_indexes = []
+        self._tables = []
+        self._table_titles = []
+        previous = None
+        for element in body._element:
+            if element.tag == _PARAGRAPH_TAG:
+                if element.find(f".//{_GRAPHIC_DATA}") is not None:
+                    self._image_anchor_indexes.append(len(self._paragraphs))
+                self._paragraphs.append(Paragraph(element, body))
+            elif element.tag == _TABLE_TAG:
+                # Table title is the text of the element right before the table.
+                title = "" if previous is None else "".join(t.text or "" for t in _RUN_TEXTS(previous))
+                self._table_titles.append(title)
+                self._tables.append(Table(element, body))
+            previous = element
+        self._paragraph_texts = [paragraph.text for paragraph in self._paragraphs]
+        self._paragraph_styles = [paragraph.style.name for paragraph in self._paragraphs]
+
+    def _text_lines(self) -> Iterator[str]:
+        """
+        Yield text lines of all paragraphs in document body, with tabs preserved.
+
+        Unlike Paragraph.text, runs placed in hyperlinks and paragraphs placed in content controls are included,
+        which is how Word stores generated tables of content. Lines are produced one paragraph at a time, the
+        text of the whole document is never built.
+        """
+        for paragraph in self.document_docx.element.body.iter(qn("w:p")):
+            parts = []
+            for node in paragraph.iter(qn("w:t"), qn("w:tab"), qn("w:br"), qn("w:cr")):
+                if node.tag == qn("w:t"):
+                    parts.append(node.text or "")
+                elif node.tag == qn("w:tab"):
+                    # Tab stop definitions in paragraph properties are not part of the text.
+                    if node.getparent().tag != qn("w:tabs"):
+                        parts.append("\t")
+                else:
+                    parts.append("\n")
+            yield from "".join(parts).split("\n")
+
+    def close(self) -> None:
+        """
+        Drop references to the parsed document, so its element tree and image parts can be freed.
+
+        A document opened with reuse_document stays in the document cache, for the next parser of the same file.
+        """
+        self.document_docx = None
+        self._paragraphs = None
+        self._image_anchor_indexes = None
+        self._tables = None
+        self._table_titles = None
+        self._paragraph_texts = None
+        self._paragraph_styles = None
+        self.image_data = None
 
     def extract_table_of_content(self) -> None:
         """Extract table of content from Word document."""
         final_directory = os.path.join(self.output_directory, settings.extracted_table_of_content)
         os.makedirs(final_directory, exist_ok=True)
         table_of_content = []
-        for line in self.document_docx2txt.split("\n"):
+        for line in self._text_lines():
             line = line.strip()
-            match_pattern = re.match(r"\d+(\.\d+)*\s+[A-Za-z].*\d+$", line)
-            if match_pattern:
-                try:
-                    text = line.rsplit("\t", 1)[0]
-                    page_number = line.rsplit("\t", 1)[1]
-                    table_of_content.append((text, page_number))
-                except IndexError:
-                    pass
-        log.info(f"Extracted TOC with {len(table_of_content)} titles.")
+            # TOC lines start with section number and end with page number separated by a tab.
+            if not line or not line[0].isdigit() or "\t" not in line:
+                continue
+            if _TOC_RE.match(line):
+                text, page_number = line.rsplit("\t", 1)
+                table_of_content.append((text, page_number))
+        log.info("Extracted TOC with %s titles.", len(table_of_content))
         if len(table_of_content) > 0:
-            toc_df = pandas.DataFrame(table_of_content, columns=["title", "page_number"])
-            toc_df.to_csv(os.path.join(final_directory, f"{self.document_name}.csv"), index=False)
+            toc_path = os.path.join(final_directory, f"{self.document_name}.csv")
+            with open(toc_path, "w", newline="", encoding="utf-8") as csvfile:
+                w = csv.writer(csvfile, lineterminator="\n")
+                w.writerow(("title", "page_number"))
+                w.writerows(table_of_content)
         self.counters['toc'] = len(table_of_content)
 
     def extract_images(self) -> None:
@@ -65,71 +242,36 @@ class WordParser(DocumentParser):
         final_directory = os.path.join(self.output_directory, settings.extracted_images)
         os.makedirs(final_directory, exist_ok=True)
 
-        def found_image_with_title(paragraph: docx.text.paragraph) -> docx.ImagePart | bool:
-            """Extract image blob data and rId from paragraph xml data."""
-            for run in paragraph.runs:
-                for inline in run._r.xpath("w:drawing/wp:inline"):
-                    image_rId = inline.graphic.graphicData.pic.blipFill.blip.embed
-                    try:
-                        image = self.document_docx.part.related_parts[image_rId].image
-                        return image
-                    except UnrecognizedImageError:
-                        return False
-
-        def save_image(figure_match: re, data: dict, image: docx.ImagePart, counter: int) -> dict:
-            """Save extracted image."""
-            save_as = f"{self.document_name}_{figure_match.group(1)}{counter}.png"
-            if image:
-                with open(os.path.join(final_directory, save_as), "wb") as img:
-                    img.write(image.blob)
-                data.update(
-                    {
-                        "figure_number": f"{figure_match.group(1)}{counter}",
-                        "figure_title": figure_match.group(2), "image_filename": save_as,
-                    }
-                )
-                return data
-            else:
-                data.update(
-                    {
-                        "figure_number": f"{figure_match.group(1)}{counter}",
-                        "figure_title": figure_match.group(2), "image_filename": "Image not extracted",
-                        "extracted_image": "No. Image has a bad format.",
-                    }
-                )
-                return data
-
         extracted_images = []
         image_titles = []
-        paragraph = self.document_docx.paragraphs
-        for i in range(len(paragraph)):
-            if "graphicData" in paragraph[i]._p.xml:
-                prev_paragraph = paragraph[i - 1]
-                next_paragraph = paragraph[i + 1]
-                if prev_paragraph.text.startswith("Figure ") and "Caption" in prev_paragraph.style.name:
-                    image_titles.append(prev_paragraph.text)
-                    extracted_images.append(found_image_with_title(paragraph[i]))
-
-                elif prev_paragraph.text == "":
-                    for j in range(2, 4):
-                        prev_paragraph = paragraph[i - j]
-                        if prev_paragraph.text.startswith("Figure ") and "Caption" in prev_paragraph.style.name:
-                            image_titles.append(prev_paragraph.text)
-                            extracted_images.append(found_image_with_title(paragraph[i]))
-                            break
-
-                elif next_paragraph.text.startswith("Figure ") and "Caption" in next_paragraph.style.name:
-                    image_titles.append(next_paragraph.text)
-                    extracted_images.append(found_image_with_title(paragraph[i]))
+        paragraph = self._paragraphs
+        texts = self._paragraph_texts
+        styles = self._paragraph_styles
+        # Caption is looked up before and after the image paragraph, indexes never wrap around the document.
+        last = len(paragraph) - 1
+        for i in self._image_anchor_indexes:
+            if i > 0 and texts[i - 1].startswith("Figure ") and "Caption" in styles[i - 1]:
+                image_titles.append(texts[i - 1])
+                extracted_images.append(_found_image_with_title(self.document_docx, paragraph[i]))
+
+            elif i > 0 and texts[i - 1] == "":
+                for j in range(2, min(4, i + 1)):
+                    if texts[i - j].startswith("Figure ") and "Caption" in styles[i - j]:
+                        image_titles.append(texts[i - j])
+                        extracted_images.append(_found_image_with_title(self.document_docx, paragraph[i]))
+                        break
+
+            elif i < last and texts[i + 1].startswith("Figure ") and "Caption" in styles[i + 1]:
+                image_titles.append(texts[i + 1])
+                extracted_images.append(_found_image_with_title(self.document_docx, paragraph[i]))
 
         counter = 0
         image_data = []
-        zipped_file = dict(zip(image_titles, extracted_images))
-        for title, image in zipped_file.items():
+        save_image = partial(_save_image, document_name=self.document_name, final_directory=final_directory)
+        for title, image in zip(image_titles, extracted_images):
             counter += 1
-            title = unidecode(title.strip())
-            figure_title = re.match(r"^(Figure\s+\d+(?:[:\.-]\d+)?)\s*(.*)", title)
-            figure_title_part = re.match(r"^(Figure\s+)(?:[\s:-])-?(.*)", title)
+            title = fast_unidecode(title.strip())
+            figure_match = _FIGURE_RE.match(title)
             data = {
                 "document_name": self.document_name,
                 "document_type": "Word",
@@ -139,15 +281,19 @@ class WordParser(DocumentParser):
                 "image_filename": "save_as",
                 "extracted_image": "Yes"
             }
-            if figure_title:
+            if figure_match is None:
+                continue
+            if figure_match.group("number"):
+                figure_title = _FigureMatch(figure_match.group("number"), figure_match.group("title"))
                 image_data.append(save_image(figure_title, data, image, ""))
-            elif figure_title_part:
+            else:
+                figure_title_part = _FigureMatch(figure_match.group("prefix"), figure_match.group("part_title"))
                 if counter == 1:
                     image_data.append(save_image(figure_title_part, data, image, counter))
                 elif counter > 1:
                     number = int(image_data[-1]["figure_number"].rsplit(" ", 1)[1]) + 1
                     image_data.append(save_image(figure_title_part, data, image, number))
-        log.info(f"...done. Successfully extracted {counter} images.")
+        log.info("...done. Successfully extracted %s images.", counter)
         self.counters["images"] = counter
         self.image_data = image_data
 
@@ -157,41 +303,27 @@ class WordParser(DocumentParser):
         final_directory = os.path.join(self.output_directory, settings.extracted_tables)
         os.makedirs(final_directory, exist_ok=True)
 
-        table_titles = []
-        name_space = {"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"}
-        for idx, element in enumerate(self.document_docx.element.body):
-            if (element.tag.endswith("tbl")) and (idx > 0):
-                title = ET.fromstring(self.document_docx.element.body[idx - 1].xml)
-                tags = []
-                for wt_tag in title.findall(".//w:r//w:t", name_space):
-                    tags.append(wt_tag.text)
-                table_title = "".join(tags)
-                table_titles.append(table_title)
-
-        tables = self.document_docx.tables
         extracted_tables = []
-        for idx, table in enumerate(tables, start=1):
+        for table in self._tables:
             extracted_table = []
             for row in table.rows:
                 row_text = [cell.text.strip() for cell in row.cells]
                 extracted_table.append(row_text)
             extracted_tables.append(extracted_table)
 
-        zip_table_title = dict(zip(table_titles, extracted_tables))
         counter = 0
-        for title, table in zip_table_title.items():
-            table_title = re.match(r"^Table\s+\d+", title.strip())
+        for title, table in zip(self._table_titles, extracted_tables):
+            table_title = _TABLE_RE.match(title.strip())
             if (title.replace(" ", "") != "") and table_title:
                 counter += 1
-                df = pandas.DataFrame(table)
-                df = df.rename(columns=df.iloc[0]).loc[1:]
-                headers = [f"{title}"]
-                if df.shape[1] != 1:
-                    headers = headers + ([""] * (df.shape[1] - 1))
-                df.columns = pandas.MultiIndex.from_tuples(zip(headers, df.columns))
+                columns_count = max(len(row) for row in table)
                 save_as = f"{self.document_name}_{counter}.csv"
-                df.to_csv(os.path.join(final_directory, save_as), index=False)
-        log.info(f"...done. Successfully extracted {counter} tables.")
+                with open(os.path.join(final_directory, save_as), "w", newline="", encoding="utf-8") as csvfile:
+                    w = csv.writer(csvfile, lineterminator="\n")
+                    # Two header rows: table title, followed by the first row of the table.
+                    w.writerow([title] + [""] * (columns_count - 1))
+                    w.writerows(table)
+        log.info("...done. Successfully extracted %s tables.", counter)
         self.counters['tables'] = counter
 
     def extract_texts(self) -> None:
@@ -200,56 +332,79 @@ class WordParser(DocumentParser):
         final_directory = os.path.join(self.output_directory, settings.extracted_texts)
         os.makedirs(final_directory, exist_ok=True)
 
-        extracted_sentences = []
-        for paragraph in self.document_docx.paragraphs:
-            text = paragraph.text
-            table_title = re.match(r"^Table\s+\d+", text)
-            figure_title = re.match(r"^Figure\s+\d+", text)
-            if (text.replace(" ", "") != "") and (not table_title) and (not figure_title):
-                extracted_sentences.append((text, paragraph.style.name))
-        sentence_df = pandas.DataFrame(extracted_sentences, columns=["text", "text_style"])
-
-        headers = []
-        body_text = []
-        tmp = []
-        for _, row_value in sentence_df.iterrows():
-            text = unidecode(row_value.text)
-            text_style = row_value.text_style
+        sections = []
+        heading = None
+        body = []
+        for text, text_style in zip(self._paragraph_texts, self._paragraph_styles):
+            if (text.replace(" ", "") == "") or _TABLE_RE.match(text) or _FIG_TITLE_RE.match(text):
+                continue
+            text = fast_unidecode(text)
             if text_style.startswith("Heading"):
-                headers.append(text)
-                body_text.append("\n".join(tmp))
-                tmp = []
+                if heading is not None:
+                    sections.append((heading, "\n".join(body)))
+                heading = text
+                body = []
             else:
-                tmp.append(text)
-        body_text.append("\n".join(tmp))
-        body_text = body_text[1:]
-        text_df = pandas.DataFrame(zip(headers, body_text), columns=["heading", "text"])
-        text_df.to_csv(os.path.join(final_directory, f"{self.document_name}.csv"), index=False)
-        log.info(f"...done. Successfully extracted {len(headers)} paragraphs.")
-        self.counters['paragraphs'] = len(headers)
+                body.append(text)
+        # Text placed before the first heading is not saved.
+        if heading is not None:
+            sections.append((heading, "\n".join(body)))
+        texts_path = os.path.join(final_directory, f"{self.document_name}.csv")
+        with open(texts_path, "w", newline="", encoding="utf-8") as csvfile:
+            w = csv.writer(csvfile, lineterminator="\n")
+            w.writerow(("heading", "text"))
+            w.writerows(sections)
+        log.info("...done. Successfully extracted %s paragraphs.", len(sections))
+        self.counters['paragraphs'] = len(sections)
+
+
+def _parse_one(document_path: str, output_directory: str) -> tuple[str, int, int] | None:
+    """
+    Parse a single Word document, used as a worker of parse_all_word_documents.
+
+    :param document_path: Full path to the Word document.
+    :param output_directory: Full path to directory, where parsing results are stored.
+    :return: document name with the numbers of extracted tables and images, None if document cannot be opened.
+    """
+    try:
+        parser = WordParser(document_path, output_directory)
+    except (PackageNotFoundError, BadZipFile) as e:
+        log.error("%s cannot be parsed. Error: %s", os.path.basename(document_path), e)
+        return None
+    parser.extract_table_of_content()
+    parser.extract_texts()
+    parser.extract_tables()
+    parser.extract_images()
+    log.info("%s successfully processed.", os.path.basename(document_path))
+    result = parser.document_name, parser.counters["tables"], parser.counters["images"]
+    parser.close()
+    del parser
+    # A worker parses many documents, collect the cyclic lxml and python-docx references before the next one.
+    gc.collect()
+    return result
 
 
 def parse_all_word_documents(
     input_directory: str = settings.file_location,
     output_directory: str = settings.parsed_data_directory,
     ) -> None:
-    """Parse all pdf documents that exist in input_directory and save results to output_directory."""
-    image_counter = []
-    table_counter = []
+    """Parse all word documents that exist in input_directory and save results to output_directory."""
+    documents = []
     for document in os.listdir(input_directory):
         if document.endswith("docx"):
-            try:
-                parser = WordParser(os.path.join(input_directory, document), output_directory)
-            except (PackageNotFoundError, BadZipFile) as e:
-                log.error(f"{document} cannot be parsed. Error: {e}")
-                break
-            parser.extract_table_of_content()
-            parser.extract_texts()
-            table_counter.append((parser.document_name, parser.extract_tables()))
-            image_counter.append((parser.document_name, parser.extract_images()))
-            log.info(f"{document} successfully processed.")
+            documents.append(os.path.join(input_directory, document))
         else:
-            log.info(f"Skipping not a word document {document}.")
+            log.info("Skipping not a word document %s.", document)
+    image_counter = []
+    table_counter = []
+    with ProcessPoolExecutor(max_workers=min(8, os.cpu_count() or 1), initializer=config_logging) as executor:
+        parse = partial(_parse_one, output_directory=output_directory)
+        for result in executor.map(parse, documents, chunksize=1):
+            if result is None:
+                continue
+            name, n_tables, n_images = result
+            table_counter.append((name, n_tables))
+            image_counter.append((name, n_images))
     with open(os.path.join(output_directory, "word_doc_image_report.csv"), "w", newline="") as image_report_file:
         csv.writer(image_report_file).writerows(image_counter)
     with open(os.path.join(output_directory, "word_doc_table_report.csv"), "w", newline="") as table_report_file:
@@ -257,5 +412,6 @@ def parse_all_word_documents(
 
 
 if __name__ == "__main__":
+    config_logging()
     parse_all_word_documents()
     
\ No newline at end of file